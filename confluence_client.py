@@ -1,7 +1,17 @@
+import os
+import hashlib
+import tempfile
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, Dict, Any, List
 from urllib.parse import urljoin, urlsplit
 
+# Read once at import so downloaded files get the same permissions as files created with open()
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 class ConfluenceAPIError(Exception):
     """Custom exception for Confluence API errors"""
 
@@ -13,36 +23,68 @@ class ConfluenceAPIError(Exception):
 class ConfluenceClient:
     """Client for interacting with the Confluence Cloud REST API"""
 
-    def __init__(self, account_name: str, user_email: str, api_token: str):
+    def __init__(self, account_name: str, user_email: str, api_token: str, pool_maxsize: int = 32):
         """Initialize the Confluence API client.
 
         Args:
             account_name: Confluence account name (e.g., 'mycompany' for mycompany.atlassian.net)
             user_email: User email for authentication
             api_token: API token for authentication
+            pool_maxsize: Maximum number of pooled connections kept open to the Confluence host
         """
 
         self.base_url = f"https://{account_name}.atlassian.net/wiki/api/v2"
         self.download_base_url = f"https://{account_name}.atlassian.net/wiki"  # Base URL for downloads without api/v2
         self.account_name = account_name
+        # Paths of the base URLs, resolved once instead of on every request
+        self._base_path = urlsplit(self.base_url).path
+        self._download_base_path = urlsplit(self.download_base_url).path
         self.auth = (user_email, api_token)
         self.headers = {
             "Accept": "application/json"
         }
 
+        # A single session keeps connections alive across calls, so the TLS
+        # handshake is paid once per pooled connection rather than per request.
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers.update(self.headers)
+        # Rate limiting (429) and transient server errors are retried with exponential backoff,
+        # honouring Retry-After. The final failed response is returned so raise_for_status
+        # still reports its status code.
+        retry = Retry(
+            total=8,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        # Attachment downloads redirect from <account>.atlassian.net to the media host
+        # (api.media.atlassian.com), so keep one pool per host instead of evicting each other.
+        self.session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=retry))
+
+    def close(self) -> None:
+        """Close the underlying HTTP session and release pooled connections."""
+
+        self.session.close()
+
+    def __enter__(self) -> 'ConfluenceClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def _build_url(self, endpoint: str) -> str:
         """Construct the full API URL for a given endpoint."""
 
-        res = urlsplit(self.base_url) # to handle existing path in base_url
-        return urljoin(self.base_url, f"{res.path}{endpoint}")
+        return urljoin(self.base_url, f"{self._base_path}{endpoint}")
 
 
     def _build_download_url(self, endpoint: str) -> str:
         """Construct the full download URL for a given endpoint."""
 
-        res = urlsplit(self.download_base_url) # to handle existing path in base_url
-        return urljoin(self.download_base_url, f"{res.path}{endpoint}")
+        return urljoin(self.download_base_url, f"{self._download_base_path}{endpoint}")
 
 
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
@@ -50,7 +92,7 @@ class ConfluenceClient:
 
         Args:
             method: HTTP method (get, post, etc.)
-            endpoint: API endpoint (e.g., '/spaces')
+            endpoint: API endpoint (e.g., '/spaces') or an absolute URL
             **kwargs: Additional arguments to pass to requests
 
         Returns:
@@ -60,16 +102,17 @@ class ConfluenceClient:
             ConfluenceAPIError: If the API request fails
         """
 
+        url = endpoint if endpoint.startswith(('https://', 'http://')) else self._build_url(endpoint)
+
         try:
-            response = requests.request(
+            response = self.session.request(
                 method,
-                self._build_url(endpoint),
-                auth=self.auth,
-                headers=self.headers,
+                url,
                 **kwargs
             )
             response.raise_for_status()
-            return response.json()
+            # orjson parses the raw bytes directly, skipping the str decode response.json() does
+            return orjson.loads(response.content)
         except requests.exceptions.HTTPError as e:
             error_data = None
             try:
@@ -81,6 +124,8 @@ class ConfluenceClient:
                 response.status_code, # pyright: ignore[reportPossiblyUnboundVariable]
                 error_data
             )
+        except orjson.JSONDecodeError as e:
+            raise ConfluenceAPIError(f"Invalid JSON in API response: {e}", response.status_code) # pyright: ignore[reportPossiblyUnboundVariable]
         except requests.exceptions.RequestException as e:
             raise ConfluenceAPIError(f"Request failed: {e}", 0)
 
@@ -102,9 +147,9 @@ class ConfluenceClient:
             data = self._make_request('get', next_url, **kwargs)
             results.extend(data.get('results', []))
             
-            # Handle pagination
+            # Handle pagination; the next link is a host-relative path such as '/wiki/api/v2/spaces?cursor=...'
             next_path = data.get('_links', {}).get('next')
-            next_url = next_path.removeprefix('/wiki/api/v2') if next_path else None
+            next_url = urljoin(self.base_url, next_path) if next_path else None
 
         return results
 
@@ -152,27 +197,40 @@ class ConfluenceClient:
 
         return self._paginated_get(f'/pages/{page_id}/attachments')
 
-    def download_attachment(self, download_url: str) -> bytes:
-        """Download an attachment from Confluence.
+    def download_attachment(self, download_url: str, dest_path: str) -> str:
+        """Download an attachment from Confluence straight to disk.
 
         Args:
             download_url: The URL to download the attachment from
+            dest_path: Local file path the attachment is written to
 
         Returns:
-            The attachment content as bytes
+            SHA-256 hex digest of the attachment content
         """
 
         url = self._build_download_url(download_url)
+        # Written to a uniquely named file next to the destination and moved into place only once
+        # complete, so a failed download never leaves a truncated file behind or overwrites an
+        # existing good copy, and concurrent downloads to the same destination never collide
+        fd, part_path = tempfile.mkstemp(dir=os.path.dirname(dest_path) or '.', suffix='.part')
+        digest = hashlib.sha256()
 
         try:
-            response = requests.get(
-                url,
-                auth=self.auth,
-                stream=True
-            )
-            response.raise_for_status()
-    
+            with os.fdopen(fd, 'wb') as f:
+                with self.session.get(url, stream=True) as response:
+                    response.raise_for_status()
+                    # iter_content maps dropped connections and read timeouts to requests exceptions
+                    for chunk in response.iter_content(chunk_size=65536):
+                        digest.update(chunk)
+                        f.write(chunk)
+            os.chmod(part_path, 0o666 & ~_UMASK)
+            os.replace(part_path, dest_path)
+            return digest.hexdigest()
+
         except requests.exceptions.HTTPError as e:
             raise ConfluenceAPIError(f"Attachment download failed: {e}", response.status_code) # pyright: ignore[reportPossiblyUnboundVariable]
-    
-        return response.content
+        except requests.exceptions.RequestException as e:
+            raise ConfluenceAPIError(f"Attachment download failed: {e}", 0)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
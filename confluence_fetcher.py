@@ -1,28 +1,91 @@
 from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import argparse
+import logging
 import re
 import subprocess
-from bs4 import BeautifulSoup, Tag
+import uuid
+from bs4 import BeautifulSoup
+from markdownify import markdownify
 from confluence_client import ConfluenceClient, ConfluenceAPIError
+from export_state import ExportState
+from pandoc_batcher import PandocBatcher, PandocBatchError
+from pandoc_server import PandocServer, PandocServerError
+
+log = logging.getLogger(__name__)
+
+# Default number of pages exported concurrently.
+MAX_WORKERS = 16
+# Number of attachments downloaded concurrently for a single page.
+ATTACHMENT_WORKERS = 4
+# Maximum number of pages sent to the pandoc server in one batch request.
+PANDOC_BATCH_SIZE = 64
+
+
+# Pandoc Lua filter that rewrites attachment links while pandoc converts the page
+_REWRITE_ATTACHMENTS_FILTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rewrite_attachments.lua')
+
+# Pages below this size without tables or Confluence macros are converted in-process instead of by pandoc
+_SIMPLE_PAGE_MAX_LENGTH = 8192
+
+# Invalid path characters and spaces are all replaced with underscores in a single pass
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?* '})
+
+# Directories already created by this process
+_MKDIR_CACHE: set[str] = set()
 
 
 def sanitize_directory_name(name: str) -> str:
     """Sanitizes a string to be a valid directory name."""
 
-    # Remove invalid characters
-    sanitized_name = re.sub(r'[<>:"/\\|?*]', '_', name)
-    # Replace spaces with underscores
-    sanitized_name = sanitized_name.replace(' ', '_')
-    return sanitized_name
+    return name.translate(_SANITIZE_TABLE)
+
+
+def ensure_dir(path: str) -> None:
+    """Creates a directory unless this process already created it."""
+
+    if path in _MKDIR_CACHE:
+        return
+    os.makedirs(path, exist_ok=True)
+    _MKDIR_CACHE.add(path)
 
 
-def html_to_markdown(html_content: str) -> str | None:
-    """Converts HTML to Markdown using pandoc."""
+def start_pandoc_server() -> PandocServer | None:
+    """Starts a long-lived pandoc server, or returns None to fall back to one pandoc process per page."""
+
+    try:
+        return PandocServer()
+    except PandocServerError as e:
+        log.warning("Pandoc server unavailable, converting each page with a separate pandoc process: %s", e)
+        return None
+
+
+def is_simple_page(html_content: str) -> bool:
+    """Checks whether a page is small and plain enough to skip pandoc."""
+
+    return (len(html_content) < _SIMPLE_PAGE_MAX_LENGTH
+            and '<table' not in html_content
+            and '<ac:' not in html_content)
+
+
+def html_to_markdown(html_content: str, pandoc: PandocServer | None = None) -> str | None:
+    """Converts HTML to Markdown using pandoc, pointing attachment links at the local copies."""
+
+    if is_simple_page(html_content):
+        return markdownify(rewrite_links(html_content), heading_style='ATX')
+
+    if pandoc:
+        # pandoc server does not run Lua filters, so links are rewritten up front
+        try:
+            return pandoc.convert(rewrite_links(html_content))
+        except PandocServerError as e:
+            log.error("Error during pandoc conversion: %s", e)
+            return None
 
     try:
         process = subprocess.run(
-            ['pandoc', '-f', 'html', '-t', 'markdown'],
+            ['pandoc', '-f', 'html', '-t', 'markdown', f'--lua-filter={_REWRITE_ATTACHMENTS_FILTER}'],
             input=html_content,
             text=True,
             capture_output=True,
@@ -30,45 +93,99 @@ def html_to_markdown(html_content: str) -> str | None:
         )
         return process.stdout
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error during pandoc conversion: {e}")
+        log.error("Error during pandoc conversion: %s", e)
         if isinstance(e, FileNotFoundError):
-            print("Pandoc is not installed or not in the system's PATH.")
+            log.error("Pandoc is not installed or not in the system's PATH.")
         return None
 
 
-def process_spaces(spaces: List[dict], args: argparse.Namespace, client: ConfluenceClient) -> None:
+def html_to_markdown_batch(html_contents: List[str], pandoc: PandocServer) -> List[str | None]:
+    """Converts several HTML documents to Markdown with one request to the pandoc server.
+
+    Each document is converted on its own by the server's /batch endpoint, so a page's output
+    does not depend on which other pages shared its batch. Raises PandocBatchError if the batch
+    fails, so that the callers convert their documents one by one.
+    """
+
+    if len(html_contents) == 1:
+        return [html_to_markdown(html_contents[0], pandoc)]
+
+    try:
+        return list(pandoc.convert_batch([rewrite_links(html_content) for html_content in html_contents]))
+    except PandocServerError as e:
+        log.warning("Batch pandoc conversion failed, converting pages individually: %s", e)
+        raise PandocBatchError(str(e))
+
+
+def process_spaces(spaces: List[dict], args: argparse.Namespace, client: ConfluenceClient,
+                   batcher: PandocBatcher | None = None) -> None:
+    # Identical attachment content is stored once, named by its SHA-256, and hardlinked into each page
+    blobs_dir = os.path.join(args.outputdir, '.blobs')
+    ensure_dir(blobs_dir)
+    # Versions exported by previous runs; unchanged pages and attachments are skipped
+    state = ExportState(os.path.join(args.outputdir, '.state.json'))
+    try:
+        _process_spaces(spaces, args, client, batcher, blobs_dir, state)
+    finally:
+        state.save()
+        prune_blobs(blobs_dir)
+
+    log.info("Done.")
+
+
+def _process_spaces(spaces: List[dict], args: argparse.Namespace, client: ConfluenceClient,
+                    batcher: PandocBatcher | None, blobs_dir: str, state: ExportState) -> None:
     for space in spaces:
         space_name = space.get('name', 'Untitled_Space')
         space_key = space.get('key', 'NO_KEY')
         sanitized_name = sanitize_directory_name(space_name)
         space_dir = os.path.join(args.outputdir, sanitized_name)
-        os.makedirs(space_dir, exist_ok=True)
-        print(f"  - Created directory for space: '{space_name}' (Key: {space_key}) -> {sanitized_name}")
-        print(f"\nProcessing Space: '{space_name}' (Key: {space_key})")
+        ensure_dir(space_dir)
+        log.info("  - Created directory for space: '%s' (Key: %s) -> %s", space_name, space_key, sanitized_name)
+        log.info("Processing Space: '%s' (Key: %s)", space_name, space_key)
 
         space_id = space.get('id')
         if not space_id:
-            print(f"  Warning: No ID found for space '{space_name}' (Key: {space_key})")
+            log.warning("  No ID found for space '%s' (Key: %s)", space_name, space_key)
             continue
 
-        print(f"  Fetching pages for space '{space_name}'...")
+        log.info("  Fetching pages for space '%s'...", space_name)
 
         try:
             pages = client.get_pages_for_space(space_id)
         except ConfluenceAPIError as e:
-            print(f"  Error processing space: {e}")
+            log.error("  Error processing space: %s", e)
             continue
     
-        print(f"  Found {len(pages)} pages.")
-        for page in pages:
-            page_title = page.get('title', 'Untitled Page')
-            sanitized_page_title = sanitize_directory_name(page_title)
-            page_dir = os.path.join(space_dir, sanitized_page_title)
-            os.makedirs(page_dir, exist_ok=True)
-            print(f"\n  Processing page: '{page_title}'")
-            export_page_content(page, page_dir, client)
-
-    print("\nDone.")
+        log.info("  Found %d pages.", len(pages))
+        # Titles are pulled out in one pass and iterated alongside their page records
+        page_titles = [page.get('title', 'Untitled Page') for page in pages]
+        # Different titles can sanitize to the same directory (e.g. 'a/b' and 'a:b'); pages must not share one
+        used_page_dirs: set[str] = set()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = []
+            for page, page_title in zip(pages, page_titles):
+                sanitized_page_title = sanitize_directory_name(page_title)
+                page_dir = os.path.join(space_dir, sanitized_page_title)
+                if page_dir.casefold() in used_page_dirs:
+                    page_dir = f"{page_dir}_{page['id']}"
+                    log.warning("  Page '%s' clashes with another page's directory, exporting to %s",
+                                page_title, page_dir)
+                used_page_dirs.add(page_dir.casefold())
+                ensure_dir(page_dir)
+                futures.append(executor.submit(export_page_content, page, page_dir, blobs_dir, client, batcher, state))
+
+            for future in as_completed(futures):
+                future.result()
+
+
+def configure_logging(quiet: bool) -> None:
+    """Sends progress messages to stderr; with quiet, only warnings and errors."""
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(handler)
+    log.setLevel(logging.WARNING if quiet else logging.INFO)
 
 
 def parse_and_validate_args() -> tuple[argparse.Namespace, ConfluenceClient]:
@@ -76,103 +193,222 @@ def parse_and_validate_args() -> tuple[argparse.Namespace, ConfluenceClient]:
     parser.add_argument('-a', '--accountname', required=True, help='Confluence account name.')
     parser.add_argument('-d', '--outputdir', required=True, help='Local output directory.')
     parser.add_argument('-s', '--spaces', help='Comma-separated list of space keys to fetch.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report warnings and errors.')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS,
+                        help=f'Number of pages to export concurrently (default: {MAX_WORKERS}).')
     args = parser.parse_args()
 
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    configure_logging(args.quiet)
+
     try:
         client = ConfluenceClient(
             account_name=args.accountname,
             user_email=os.getenv('CONFL_USER_EMAIL', ''),
-            api_token=os.getenv('CONFL_API_TOKEN', '')
+            api_token=os.getenv('CONFL_API_TOKEN', ''),
+            # Every page worker may have a full set of attachment downloads in flight
+            pool_maxsize=args.workers * ATTACHMENT_WORKERS
         )
         return args, client
     except ValueError as e:
-        print(f'Error: {e}')
+        log.error('Error: %s', e)
         exit(1)
 
 
-def handle_attachments(page_dir: str, page: dict, client: ConfluenceClient) -> None:
+def handle_attachments(page_title: str, page_dir: str, blobs_dir: str, attachments: List[dict],
+                       client: ConfluenceClient, state: ExportState | None = None) -> None:
     attachments_dir = os.path.join(page_dir, 'attachments')
-    attachments = client.get_page_attachments(page['id'])
     if attachments:
-        os.makedirs(attachments_dir, exist_ok=True)
-        print(f"    Found {len(attachments)} attachments.")
-        
-        for attachment in attachments:
-            file_name = attachment.get('title')
-            download_link = attachment.get('_links', {}).get('download')
-            if file_name and download_link:
-                try:
-                    content = client.download_attachment(download_link)
-                    file_path = os.path.join(attachments_dir, file_name)
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
-                    print(f"      Downloaded: {file_name}")
-                except ConfluenceAPIError as e:
-                    print(f"      Error downloading {file_name}: {e}")
+        ensure_dir(attachments_dir)
+        log.info("    '%s': found %d attachments.", page_title, len(attachments))
+
+        with ThreadPoolExecutor(max_workers=ATTACHMENT_WORKERS) as executor:
+            # Drain the iterator so exceptions raised by workers propagate here
+            list(executor.map(
+                lambda attachment: save_attachment(page_title, attachments_dir, blobs_dir, attachment, client, state),
+                attachments
+            ))
+
+
+def save_attachment(page_title: str, attachments_dir: str, blobs_dir: str, attachment: dict,
+                    client: ConfluenceClient, state: ExportState | None = None) -> None:
+    """Download a single attachment into the page's attachments directory."""
+
+    file_name = attachment.get('title')
+    download_link = attachment.get('_links', {}).get('download')
+    attachment_id = attachment.get('id')
+    version = ExportState.version_of(attachment)
+    if file_name and download_link:
+        try:
+            file_path = os.path.join(attachments_dir, file_name)
+            if state and attachment_id and state.is_current('attachments', attachment_id, version) \
+                    and os.path.exists(file_path):
+                log.info("      '%s': unchanged attachment %s", page_title, file_name)
+                return
+
+            digest = client.download_attachment(download_link, file_path)
+            share_blob(file_path, os.path.join(blobs_dir, digest))
+            if state and attachment_id:
+                state.update('attachments', attachment_id, version)
+            log.info("      '%s': downloaded %s", page_title, file_name)
+        except ConfluenceAPIError as e:
+            log.error("      '%s': error downloading %s: %s", page_title, file_name, e)
+
+
+def share_blob(file_path: str, blob_path: str) -> None:
+    """Makes a downloaded file share storage with the blob holding identical content.
+
+    The first file with given content becomes the blob; later ones are replaced by a hardlink to it.
+    Where hardlinks are not supported the downloaded file is simply kept.
+    """
+
+    try:
+        os.link(file_path, blob_path)
+        return
+    except FileExistsError:
+        pass
+    except OSError:
+        return
+
+    link_path = f"{file_path}.{uuid.uuid4().hex}.link"
+    try:
+        os.link(blob_path, link_path)
+        os.replace(link_path, file_path)
+    except OSError:
+        if os.path.lexists(link_path):
+            os.remove(link_path)
+
+
+def prune_blobs(blobs_dir: str) -> None:
+    """Removes blobs no longer linked from any page, e.g. the old content of an updated attachment."""
+
+    for entry in os.scandir(blobs_dir):
+        if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_nlink == 1:
+            os.remove(entry.path)
+
+
+# CDATA sections (e.g. code macro bodies) are matched first so they are passed through untouched;
+# otherwise the double-quoted src of an <img> or href of an <a> pointing at an attachment download,
+# with 'path' excluding the query string
+_CDATA_RE = r'<!\[CDATA\[.*?\]\]>'
+_ATTACHMENT_LINK_RE = re.compile(
+    rf'(?P<cdata>{_CDATA_RE})'
+    r'|(?P<prefix><img\b[^>]*?\ssrc="|<a\b[^>]*?\shref=")(?P<path>[^"]*?/download/attachments/[^"?]*)[^"]*"',
+    re.DOTALL | re.IGNORECASE
+)
+_CDATA_SECTION_RE = re.compile(_CDATA_RE, re.DOTALL)
+# Only images and links that point at Confluence attachment downloads need rewriting
+_ATTACHMENT_LINK_SELECTOR = 'img[src*="/download/attachments/"], a[href*="/download/attachments/"]'
 
 
 # Rewrite links in HTML
 def rewrite_links(html_content: str) -> str:
     """Rewrites attachment links in HTML content to point to local files."""
 
+    rewritten = _ATTACHMENT_LINK_RE.sub(_rewrite_link_match, html_content)
+    if '/download/attachments/' not in _CDATA_SECTION_RE.sub('', rewritten):
+        return rewritten
+
+    # Something the regex could not handle (e.g. single-quoted attributes); let the HTML parser decide
+    return _rewrite_links_with_parser(rewritten)
+
+
+def _rewrite_link_match(match: re.Match) -> str:
+    """Returns the replacement for one _ATTACHMENT_LINK_RE match."""
+
+    if match.group('cdata'):
+        return match.group('cdata')
+    return f'{match.group("prefix")}attachments/{os.path.basename(match.group("path"))}"'
+
+
+def _rewrite_links_with_parser(html_content: str) -> str:
+    """Rewrites attachment links by parsing the HTML; slower fallback for rewrite_links."""
+
     soup = BeautifulSoup(html_content, 'html.parser')
-    for tag in soup.find_all(['img', 'a']):
-        if not isinstance(tag, Tag):
-            continue
+    for tag in soup.select(_ATTACHMENT_LINK_SELECTOR):
         attr = 'src' if tag.name == 'img' else 'href'
         link = tag.get(attr)
-        if isinstance(link, str) and '/download/attachments/' in link:
+        if isinstance(link, str):
             file_name = os.path.basename(link.split('?')[0])
             tag[attr] = f"attachments/{file_name}"
     return str(soup)
 
 
-def export_page_content(page: dict, page_dir: str, client: ConfluenceClient) -> None:
+def export_page_content(page: dict, page_dir: str, blobs_dir: str, client: ConfluenceClient,
+                        batcher: PandocBatcher | None = None, state: ExportState | None = None) -> None:
     """Process a single page's content and attachments."""
 
-    try:
-        page_content = client.get_page_content(page['id'])
-    except ConfluenceAPIError as e:
-        print(f"    Error fetching page content: {e}")
+    page_title = page.get('title', 'Untitled Page')
+    log.info("  Processing page: '%s'", page_title)
+    md_file_path = os.path.join(page_dir, 'page.md')
+    version = ExportState.version_of(page)
+    if state and state.is_current('pages', page['id'], version) and os.path.exists(md_file_path):
+        # Attachments can change without a new page version, so they are still checked
+        log.info("    '%s': page unchanged, skipping conversion", page_title)
+        try:
+            handle_attachments(page_title, page_dir, blobs_dir, client.get_page_attachments(page['id']), client, state)
+        except ConfluenceAPIError as e:
+            log.error("    '%s': error fetching attachments: %s", page_title, e)
         return
 
-    html_content = page_content.get('body', {}).get('storage', {}).get('value')
-    if not html_content:
-        print(f"    No content found for page: {page.get('title', 'Untitled Page')}")
-        return
+    # The content and the attachment listing are independent, so both requests are issued at once;
+    # attachments are then downloaded while pandoc converts the page.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        content_future = executor.submit(client.get_page_content, page['id'])
+        attachments_future = executor.submit(client.get_page_attachments, page['id'])
 
-    try:
-        handle_attachments(page_dir, page, client)
-    except ConfluenceAPIError as e:
-        print(f"    Error fetching attachments: {e}")
+        try:
+            page_content = content_future.result()
+        except ConfluenceAPIError as e:
+            log.error("    '%s': error fetching page content: %s", page_title, e)
+            return
 
-    # Process HTML content
-    modified_html = rewrite_links(html_content)
+        html_content = page_content.get('body', {}).get('storage', {}).get('value')
+        if not html_content:
+            log.warning("    '%s': no content found", page_title)
+            return
 
-    # Convert to Markdown
-    markdown_content = html_to_markdown(modified_html)
-    if not markdown_content:
-        return
+        downloads_future = executor.submit(
+            lambda: handle_attachments(page_title, page_dir, blobs_dir, attachments_future.result(), client, state)
+        )
 
-    md_file_path = os.path.join(page_dir, 'page.md')
-    with open(md_file_path, 'w', encoding='utf-8') as f:
-        f.write(markdown_content)
-    print(f"    Saved page content to: {md_file_path}")
+        # Convert to Markdown
+        if batcher and not is_simple_page(html_content):
+            markdown_content = batcher.convert(html_content)
+        else:
+            markdown_content = html_to_markdown(html_content)
+        if markdown_content:
+            with open(md_file_path, 'w', encoding='utf-8') as f:
+                f.write(markdown_content)
+            if state:
+                state.update('pages', page['id'], version)
+            log.info("    '%s': saved page content to %s", page_title, md_file_path)
+        else:
+            log.error("    '%s': page content could not be converted", page_title)
+
+        try:
+            downloads_future.result()
+        except ConfluenceAPIError as e:
+            log.error("    '%s': error fetching attachments: %s", page_title, e)
 
 
 def prepare_output_directory(spaces: List[dict] | None, conf_spaces: str, output_dir: str) -> List[dict]:
     if not spaces:
-        print('No spaces found or error fetching spaces.')
+        log.error('No spaces found or error fetching spaces.')
         exit(1)
 
     if spaces:
         selected_space_keys = [key.strip() for key in conf_spaces.split(',')]
-        print(selected_space_keys)
-        spaces = [s for s in spaces if s.get('key') in selected_space_keys]
-        print(f"Filtering for spaces: {', '.join(selected_space_keys)}")
-
-    print(f"Found {len(spaces)} spaces. Creating directories in {output_dir}...")
-    os.makedirs(output_dir, exist_ok=True)
+        log.debug("Selected space keys: %s", selected_space_keys)
+        selected = set(selected_space_keys)
+        space_keys = [s.get('key') for s in spaces]
+        spaces = [s for s, key in zip(spaces, space_keys) if key in selected]
+        log.info("Filtering for spaces: %s", ', '.join(selected_space_keys))
+
+    log.info("Found %d spaces. Creating directories in %s...", len(spaces), output_dir)
+    ensure_dir(output_dir)
     return spaces
 
 
@@ -181,15 +417,31 @@ def main():
 
     args, client = parse_and_validate_args()
 
-    print(f"Fetching spaces from {args.accountname}...")
-    try:
-        spaces = client.get_spaces()
-    except ConfluenceAPIError as e:
-        print(f"Error getting spaces: {e}")
-        exit(1)
-
-    spaces = prepare_output_directory(spaces, args.spaces, args.outputdir)
-    process_spaces(spaces, args, client)
+    with client:
+        log.info("Fetching spaces from %s...", args.accountname)
+        try:
+            spaces = client.get_spaces()
+        except ConfluenceAPIError as e:
+            log.error("Error getting spaces: %s", e)
+            exit(1)
+
+        spaces = prepare_output_directory(spaces, args.spaces, args.outputdir)
+
+        pandoc = start_pandoc_server()
+        # Pages that queue up while the pandoc server is busy are sent to it in one request.
+        # Without the server every page runs its own pandoc process, in parallel on the page workers.
+        batcher = None
+        if pandoc:
+            batcher = PandocBatcher(lambda html_contents: html_to_markdown_batch(html_contents, pandoc),
+                                    lambda html_content: html_to_markdown(html_content, pandoc),
+                                    batch_size=PANDOC_BATCH_SIZE)
+        try:
+            process_spaces(spaces, args, client, batcher)
+        finally:
+            if batcher:
+                batcher.close()
+            if pandoc:
+                pandoc.close()
 
 
 if __name__ == '__main__':
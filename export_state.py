@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+class ExportState:
+    """Versions of pages and attachments written by previous exports, persisted as JSON"""
+
+    def __init__(self, path: str):
+        """Load the state file, starting empty if it does not exist or cannot be read.
+
+        Args:
+            path: Location of the state file (e.g., '<outputdir>/.state.json')
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Dict[str, Any]] = {'pages': {}, 'attachments': {}}
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+
+        for kind in self._versions:
+            if isinstance(data.get(kind), dict):
+                self._versions[kind] = data[kind]
+
+    @staticmethod
+    def version_of(item: Dict[str, Any]) -> Optional[int]:
+        """Extract the version number from a page or attachment record."""
+
+        return (item.get('version') or {}).get('number')
+
+    def is_current(self, kind: str, item_id: str, version: Optional[int]) -> bool:
+        """Check whether an item was already exported at the given version.
+
+        Args:
+            kind: 'pages' or 'attachments'
+            item_id: The ID of the page or attachment
+            version: The version reported by Confluence
+
+        Returns:
+            True if the stored version matches
+        """
+
+        if version is None:
+            return False
+        with self._lock:
+            return self._versions[kind].get(item_id) == version
+
+    def update(self, kind: str, item_id: str, version: Optional[int]) -> None:
+        """Record that an item was exported at the given version."""
+
+        if version is None:
+            return
+        with self._lock:
+            self._versions[kind][item_id] = version
+
+    def save(self) -> None:
+        """Write the state file atomically."""
+
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._versions, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,98 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+
+class PandocBatchError(Exception):
+    """Raised by a batch converter when a batch cannot be converted as a whole"""
+
+
+class PandocBatcher:
+    """Collects documents submitted from many threads and converts them in batches on one collector thread"""
+
+    def __init__(self, convert_batch: Callable[[List[str]], List[Optional[str]]],
+                 convert_one: Callable[[str], Optional[str]],
+                 batch_size: int = 64):
+        """Start the collector thread.
+
+        Args:
+            convert_batch: Converts a list of documents, returning one result (or None on failure) per document;
+                raises PandocBatchError if the batch has to be converted document by document instead
+            convert_one: Converts a single document; used on the caller's thread when its batch failed
+            batch_size: Maximum number of documents handed to convert_batch at once
+        """
+
+        self._convert_batch = convert_batch
+        self._convert_one = convert_one
+        self._batch_size = batch_size
+        self._queue: queue.Queue[Optional[Tuple[str, Future]]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='pandoc-batcher', daemon=True)
+        self._thread.start()
+
+    def convert(self, text: str) -> Optional[str]:
+        """Queue a document and block until it has been converted.
+
+        Args:
+            text: Source document
+
+        Returns:
+            The converted document, or None if conversion failed
+        """
+
+        future: Future = Future()
+        self._queue.put((text, future))
+        try:
+            return future.result()
+        except PandocBatchError:
+            # Converting the failed batch one by one here keeps the collector free for other batches
+            return self._convert_one(text)
+
+    def _next_batch(self) -> Tuple[List[Tuple[str, Future]], bool]:
+        """Wait for a document, then take whatever else is already queued; the flag is set once closed."""
+
+        item = self._queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        while len(batch) < self._batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        closed = False
+        while not closed:
+            batch, closed = self._next_batch()
+            if not batch:
+                continue
+
+            try:
+                results = self._convert_batch([text for text, _ in batch])
+            except Exception as e:
+                # Any failure sends the documents back to their callers for individual conversion
+                error = e if isinstance(e, PandocBatchError) else PandocBatchError(str(e))
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self) -> None:
+        """Convert any queued documents and stop the collector thread."""
+
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> 'PandocBatcher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,154 @@
+import socket
+import subprocess
+import time
+import requests
+from typing import List, Optional
+
+
+class PandocServerError(Exception):
+    """Custom exception for pandoc server failures"""
+
+
+class PandocServer:
+    """Long-lived `pandoc server` process that converts documents over HTTP"""
+
+    def __init__(self, executable: str = 'pandoc', startup_timeout: float = 10.0, conversion_timeout: int = 60):
+        """Start a pandoc server on a free local port.
+
+        Args:
+            executable: Name or path of the pandoc binary
+            startup_timeout: Seconds to wait for the server to accept requests
+            conversion_timeout: Seconds pandoc may spend on a single conversion
+
+        Raises:
+            PandocServerError: If the server cannot be started
+        """
+
+        self.port = self._find_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        # Separate from the Confluence session so credentials never reach the local server
+        self.session = requests.Session()
+
+        try:
+            self.process: Optional[subprocess.Popen] = subprocess.Popen(
+                [executable, 'server', '--port', str(self.port), '--timeout', str(conversion_timeout)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            self.process = None
+            raise PandocServerError(f"Could not start pandoc server: {e}")
+
+        self._wait_until_ready(startup_timeout)
+
+    @staticmethod
+    def _find_free_port() -> int:
+        """Ask the OS for an unused local TCP port."""
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _wait_until_ready(self, timeout: float) -> None:
+        """Poll the server until it answers or the timeout expires."""
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process is None or self.process.poll() is not None:
+                self.close()
+                raise PandocServerError("pandoc server exited during startup (pandoc >= 3.0 is required)")
+            try:
+                self.session.get(f"{self.url}/version", timeout=1).raise_for_status()
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+
+        self.close()
+        raise PandocServerError(f"pandoc server did not start within {timeout} seconds")
+
+    def convert(self, text: str, from_format: str = 'html', to_format: str = 'markdown') -> str:
+        """Convert a document with the running server.
+
+        Args:
+            text: Source document
+            from_format: Pandoc input format
+            to_format: Pandoc output format
+
+        Returns:
+            The converted document
+
+        Raises:
+            PandocServerError: If the conversion fails
+        """
+
+        try:
+            response = self.session.post(
+                f"{self.url}/",
+                json={"text": text, "from": from_format, "to": to_format},
+                headers={"Accept": "text/plain"}
+            )
+        except requests.exceptions.RequestException as e:
+            raise PandocServerError(f"Request to pandoc server failed: {e}")
+
+        if response.status_code != 200:
+            raise PandocServerError(f"pandoc server conversion failed: {response.text.strip()}")
+        # pandoc always emits UTF-8; decoding explicitly avoids requests guessing the charset
+        return response.content.decode('utf-8')
+
+    def convert_batch(self, texts: List[str], from_format: str = 'html', to_format: str = 'markdown') -> List[str]:
+        """Convert several documents with a single request to the server's /batch endpoint.
+
+        Args:
+            texts: Source documents
+            from_format: Pandoc input format
+            to_format: Pandoc output format
+
+        Returns:
+            The converted documents, in the same order
+
+        Raises:
+            PandocServerError: If the conversion fails
+        """
+
+        try:
+            response = self.session.post(
+                f"{self.url}/batch",
+                json=[{"text": text, "from": from_format, "to": to_format} for text in texts],
+                headers={"Accept": "application/json"}
+            )
+        except requests.exceptions.RequestException as e:
+            raise PandocServerError(f"Request to pandoc server failed: {e}")
+
+        if response.status_code != 200:
+            raise PandocServerError(f"pandoc server conversion failed: {response.text.strip()}")
+
+        try:
+            results = response.json()
+        except ValueError as e:
+            raise PandocServerError(f"Invalid batch response from pandoc server: {e}")
+        if not isinstance(results, list) or len(results) != len(texts):
+            raise PandocServerError("pandoc server returned a batch of unexpected size")
+        # Each successful result is an object with an 'output' field; anything else is a failed item
+        outputs = []
+        for result in results:
+            if not isinstance(result, dict) or not isinstance(result.get('output'), str):
+                raise PandocServerError(f"pandoc server failed to convert a batch item: {result}")
+            outputs.append(result['output'])
+        return outputs
+
+    def close(self) -> None:
+        """Stop the server process and release the HTTP session."""
+
+        self.session.close()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self) -> 'PandocServer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
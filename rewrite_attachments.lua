@@ -0,0 +1,26 @@
+-- Pandoc Lua filter that points Confluence attachment links at the locally
+-- downloaded copies in the page's attachments/ directory.
+
+local function local_attachment_path(url)
+  if not url:find('/download/attachments/', 1, true) then
+    return nil
+  end
+  local path = url:match('^[^?]*')
+  return 'attachments/' .. path:match('([^/]*)$')
+end
+
+function Image(el)
+  local path = local_attachment_path(el.src)
+  if path then
+    el.src = path
+    return el
+  end
+end
+
+function Link(el)
+  local path = local_attachment_path(el.target)
+  if path then
+    el.target = path
+    return el
+  end
+end